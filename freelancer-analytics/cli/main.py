@@ -1,12 +1,17 @@
 import typer
 import hashlib
+import time
 import pandas as pd
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from core.data_processing import DataProcessor
 from core.query_analysis import QueryAnalyzer
 from core.caching import DataCache
 from core.logging import QueryLogger
-from core.llm_integration import LLMGenerator
+from core.llm_integration import LLMGenerator, LLMError
+from core.metrics import (
+    MetricsFileFlusher, start_http_server, METRICS_PORT,
+    QUERY_DURATION, STAGE_DURATION, QUERIES, ROWS_SCANNED
+)
 from config.settings import Settings
 import os
 from dotenv import load_dotenv
@@ -79,12 +84,17 @@ def _prepare_income_data(df: pd.DataFrame, analyzed_query: dict) -> Dict[str, An
 
     return stats
 
-@app.command()
-def ask(
-    query: str,
-    use_cache: bool = typer.Option(True, help="Использовать кэширование"),
-    verbose: bool = typer.Option(False, help="Подробный вывод")
-):
+def _handle_query(query: str, use_cache: bool, verbose: bool) -> None:
+    start = time.perf_counter()
+    status = "error"
+    try:
+        status = _process_query(query, use_cache, verbose)
+    finally:
+        QUERY_DURATION.observe(time.perf_counter() - start, status=status)
+        QUERIES.inc(status=status)
+
+def _process_query(query: str, use_cache: bool, verbose: bool) -> str:
+    """Обрабатывает запрос и возвращает статус для метрик: cached, ok, no_data, llm_error или error"""
     cache_key = f"query:{hashlib.md5(query.encode()).hexdigest()}"
     
     if use_cache and (cached_response := cache.get(cache_key)):
@@ -92,16 +102,20 @@ def ask(
             typer.echo("ℹ️ Используется кэшированный ответ")
         typer.echo(f"\n📤 Ответ: {cached_response}")
         query_logger.log(query, "INFO", "Ответ взят из кэша")
-        return
+        return "cached"
 
     try:
-        processor = DataProcessor()
-        df = processor.get_data()
+        with STAGE_DURATION.time(stage="load_data"):
+            processor = DataProcessor()
+            df = processor.get_data()
+        ROWS_SCANNED.observe(len(df))
         
-        query_analyzer = QueryAnalyzer()
-        analyzed_query = query_analyzer.analyze(query)
+        with STAGE_DURATION.time(stage="analyze_query"):
+            query_analyzer = QueryAnalyzer()
+            analyzed_query = query_analyzer.analyze(query)
         print(f"Analyzed query: {analyzed_query}")
-        prepared_data = _prepare_income_data(df, analyzed_query)
+        with STAGE_DURATION.time(stage="prepare_data"):
+            prepared_data = _prepare_income_data(df, analyzed_query)
         
         if verbose:
             typer.echo(f"✅ Загружено {len(df)} записей")
@@ -118,15 +132,25 @@ def ask(
                         typer.echo(f"• {key.replace('_', ' ').capitalize()}: {value}")
 
         if "error" in prepared_data:
-            response = f"Невозможно ответить на запрос: {prepared_data['error']}."
-        else:
-            response = llm_generator.generate_response(query, prepared_data['statistics'])
+            typer.echo(f"\n📤 Ответ:\nНевозможно ответить на запрос: {prepared_data['error']}.")
+            query_logger.log(query, "INFO", f"Недостаточно данных: {prepared_data['error']}")
+            return "no_data"
+
+        try:
+            with STAGE_DURATION.time(stage="llm"):
+                response = llm_generator.generate_response(query, prepared_data['statistics'])
+        except LLMError as e:
+            # Ошибку LLM не кэшируем, чтобы следующий запрос попробовал снова
+            typer.echo(f"⚠️ {e}")
+            query_logger.log(query, "ERROR", str(e))
+            return "llm_error"
         
         if use_cache:
             cache.set(cache_key, response)
         
         query_logger.log(query, "INFO", "Запрос успешно обработан")
         typer.echo(f"\n📤 Ответ:\n{response}")
+        return "ok"
         
     except ValueError as e:
         error_msg = f"Ошибка данных: {str(e)}"
@@ -136,6 +160,50 @@ def ask(
         error_msg = f"Неожиданная ошибка: {str(e)}"
         typer.echo(f"⚠️ {error_msg}")
         query_logger.log(query, "ERROR", error_msg)
+    return "error"
+
+@app.command()
+def ask(
+    query: Optional[str] = typer.Argument(None, help="Запрос; в режиме --serve можно не указывать"),
+    use_cache: bool = typer.Option(True, help="Использовать кэширование"),
+    verbose: bool = typer.Option(False, help="Подробный вывод"),
+    serve: bool = typer.Option(False, help="Режим сервера: читать запросы из stdin и отдавать метрики по HTTP"),
+    metrics_port: int = typer.Option(METRICS_PORT, help="Порт эндпоинта /metrics в режиме сервера"),
+    metrics_host: str = typer.Option("127.0.0.1", help="Адрес эндпоинта /metrics в режиме сервера (0.0.0.0 — все интерфейсы)")
+):
+    if serve:
+        _serve(query, use_cache, verbose, metrics_port, metrics_host)
+        return
+    if not query:
+        raise typer.BadParameter("Укажите запрос или используйте --serve", param_hint="QUERY")
+
+    # Режим CLI: метрики сохраняются в локальный файл
+    flusher = MetricsFileFlusher()
+    flusher.start()
+    try:
+        _handle_query(query, use_cache, verbose)
+    finally:
+        flusher.stop()
+
+def _serve(query: Optional[str], use_cache: bool, verbose: bool, port: int, host: str) -> None:
+    """Читает запросы из stdin построчно и отдаёт метрики Prometheus по HTTP"""
+    server = start_http_server(port, host)
+    typer.echo(f"📈 Метрики доступны на http://{host}:{port}/metrics")
+    try:
+        if query:
+            _handle_query(query, use_cache, verbose)
+        while True:
+            try:
+                query = input("❓ Запрос: ").strip()
+            except EOFError:
+                break
+            if query:
+                _handle_query(query, use_cache, verbose)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
 
 if __name__ == "__main__":
     app()
\ No newline at end of file
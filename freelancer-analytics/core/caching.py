@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Any, Dict
 import os
+from core.metrics import CACHE_LOOKUPS
 
 CACHE_DIR = Path("cache")
 CACHE_EXPIRY_DAYS = 7
@@ -20,6 +21,7 @@ class DataCache:
         """Получает данные из кэша"""
         cache_file = self._get_cache_path(key)
         if not cache_file.exists():
+            CACHE_LOOKUPS.inc(result="miss")
             return None
             
         try:
@@ -30,11 +32,14 @@ class DataCache:
             cache_time = datetime.fromisoformat(data["timestamp"])
             if datetime.now() - cache_time > timedelta(days=CACHE_EXPIRY_DAYS):
                 cache_file.unlink()
+                CACHE_LOOKUPS.inc(result="expired")
                 return None
                 
+            CACHE_LOOKUPS.inc(result="hit")
             return data["data"]
         except (json.JSONDecodeError, KeyError):
             cache_file.unlink()
+            CACHE_LOOKUPS.inc(result="corrupt")
             return None
     
     def set(self, key: str, data: Any) -> None:
@@ -1,8 +1,12 @@
 import os
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import requests
 import logging
 import pandas as pd
 from dotenv import load_dotenv
+from core.metrics import LLM_REQUESTS, LLM_ERRORS, LLM_RETRIES, LLM_TOKENS, LLM_DURATION
 
 # Настройка логирования
 logging.basicConfig(
@@ -63,7 +67,16 @@ class DataHandler:
             logging.error(f"❌ Ошибка загрузки данных: {e}")
             raise
 
+class LLMError(Exception):
+    """LLM API не вернул ответ после всех попыток"""
+
+
 class LLMGenerator:
+    MAX_RETRIES = 2
+    RETRY_BACKOFF = 1.0  # секунды, удваивается с каждой попыткой
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+    MAX_RETRY_AFTER = 30.0  # секунды, верхняя граница для заголовка Retry-After
+
     def __init__(self, settings):
         self.settings = settings
         self.headers = {
@@ -72,29 +85,92 @@ class LLMGenerator:
         }
     
     def generate_response(self, query: str, data_stats: dict) -> str:
-        """Анализ данных через LLM API"""
+        """Анализ данных через LLM API; при неудаче выбрасывает LLMError"""
         prompt = self._build_prompt(query, data_stats)
+        model = self.settings.MODEL
+        payload = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": "Ты аналитик данных. Отвечай точно и кратко."},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.3,
+            "max_tokens": 300
+        }
 
+        retry_after = None
+        for attempt in range(self.MAX_RETRIES + 1):
+            if attempt:
+                LLM_RETRIES.inc(model=model)
+                delay = self.RETRY_BACKOFF * 2 ** (attempt - 1)
+                time.sleep(retry_after if retry_after is not None else delay)
+                retry_after = None
+            LLM_REQUESTS.inc(model=model)
+            try:
+                with LLM_DURATION.time(model=model):
+                    response = requests.post(
+                        self.settings.API_URL,
+                        headers=self.headers,
+                        json=payload,
+                        timeout=15
+                    )
+                response.raise_for_status()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                LLM_ERRORS.inc(model=model, reason="timeout" if isinstance(e, requests.Timeout) else "connection_error")
+                error = e
+                continue
+            except requests.HTTPError as e:
+                LLM_ERRORS.inc(model=model, reason=f"http_{e.response.status_code}")
+                error = e
+                if e.response.status_code in self.RETRY_STATUS_CODES:
+                    retry_after = self._parse_retry_after(e.response.headers.get("Retry-After"))
+                    continue
+                break
+            except requests.RequestException as e:
+                LLM_ERRORS.inc(model=model, reason="request_error")
+                error = e
+                break
+
+            # Разбор ответа отдельно: InvalidURL и т.п. тоже наследуют ValueError
+            try:
+                body = response.json()
+                content = body["choices"][0]["message"]["content"]
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                LLM_ERRORS.inc(model=model, reason="invalid_response")
+                error = e
+                break
+            self._record_usage(model, body.get("usage"))
+            return content
+
+        logging.error(f"❌ API ошибка: {error}")
+        raise LLMError(f"Не удалось получить анализ: {error}") from error
+
+    def _parse_retry_after(self, value):
+        """Задержка из Retry-After (секунды или HTTP-дата), ограниченная MAX_RETRY_AFTER"""
+        if not value:
+            return None
         try:
-            response = requests.post(
-                self.settings.API_URL,
-                headers=self.headers,
-                json={
-                    "model": self.settings.MODEL,
-                    "messages": [
-                        {"role": "system", "content": "Ты аналитик данных. Отвечай точно и кратко."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    "temperature": 0.3,
-                    "max_tokens": 300
-                },
-                timeout=15
-            )
-            response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"]
-        except Exception as e:
-            logging.error(f"❌ API ошибка: {e}")
-            return f"Не удалось получить анализ: {e}"
+            seconds = float(value)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            if retry_at.tzinfo is None:
+                retry_at = retry_at.replace(tzinfo=timezone.utc)
+            seconds = (retry_at - datetime.now(timezone.utc)).total_seconds()
+        if seconds != seconds:  # NaN
+            return None
+        return min(max(seconds, 0.0), self.MAX_RETRY_AFTER)
+
+    @staticmethod
+    def _record_usage(model: str, usage) -> None:
+        # Учёт токенов не должен ломать успешный ответ
+        if not isinstance(usage, dict):
+            return
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if isinstance(usage.get(kind), int):
+                LLM_TOKENS.inc(usage[kind], model=model, kind=kind.split("_")[0])
     
     def _build_prompt(self, query: str, data_stats: dict) -> str:
         stats_str = "\n".join(
@@ -0,0 +1,366 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+METRICS_DIR = Path("metrics")
+METRICS_STATE_FILE = METRICS_DIR / "metrics.json"
+METRICS_TEXT_FILE = METRICS_DIR / "metrics.prom"
+METRICS_FLUSH_INTERVAL = 15  # секунды
+METRICS_PORT = 9108
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0, 60.0)
+ROWS_BUCKETS = (0, 10, 100, 1000, 5000, 10000, 50000, 100000, 500000, 1000000)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _diff_state(current: dict, previous: dict) -> dict:
+    """Разница между двумя снимками MetricsRegistry.dump()"""
+    diff = {}
+    for name, values in current.items():
+        seen = {tuple(key): value for key, value in previous.get(name, [])}
+        rows = []
+        for key, value in values:
+            old = seen.get(tuple(key))
+            if old is None:
+                rows.append([key, value])
+            elif isinstance(value, dict):
+                rows.append([key, {
+                    "buckets": [a - b for a, b in zip(value["buckets"], old["buckets"])],
+                    "sum": value["sum"] - old["sum"],
+                    "count": value["count"] - old["count"]
+                }])
+            else:
+                rows.append([key, value - old])
+        diff[name] = rows
+    return diff
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """Эксклюзивная блокировка файла между процессами"""
+    with open(path, "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class _Metric:
+    TYPE = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получено {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self, name: Optional[str] = None) -> list:
+        name = name or self.name
+        return [f"# HELP {name} {self.documentation}", f"# TYPE {name} {self.TYPE}"]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """Увеличивает счётчик на amount"""
+        if amount < 0:
+            raise ValueError("Счётчик может только увеличиваться")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list:
+        # В формате 0.0.4 HELP/TYPE должны называть саму серию, т.е. с суффиксом _total
+        lines = self._header(f"{self.name}_total")
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                labels = dict(zip(self.labelnames, key))
+                lines.append(f"{self.name}_total{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+    def dump(self) -> list:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def load(self, state: list) -> None:
+        with self._lock:
+            for key, value in state:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0) + value
+
+
+class Histogram(_Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def _empty(self) -> dict:
+        return {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+
+    def observe(self, value: float, **labels) -> None:
+        """Регистрирует наблюдение в гистограмме"""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.setdefault(key, self._empty())
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замеряет длительность блока кода в секундах"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list:
+        lines = self._header()
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                labels = dict(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets, state["buckets"]):
+                    cumulative += count
+                    bucket_labels = {**labels, "le": _format_value(bound)}
+                    lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(state['sum'])}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {state['count']}")
+        return lines
+
+    def dump(self) -> list:
+        with self._lock:
+            return [[list(key), {**state, "buckets": list(state["buckets"])}] for key, state in self._values.items()]
+
+    def load(self, state: list) -> None:
+        with self._lock:
+            for key, saved in state:
+                # Сохранённое состояние с другим набором бакетов пропускаем
+                if len(saved.get("buckets", [])) != len(self.buckets):
+                    continue
+                current = self._values.setdefault(tuple(key), self._empty())
+                current["buckets"] = [a + b for a, b in zip(current["buckets"], saved["buckets"])]
+                current["sum"] += saved["sum"]
+                current["count"] += saved["count"]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Возвращает все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def dump(self) -> dict:
+        return {name: metric.dump() for name, metric in self._metrics.items()}
+
+    def empty_copy(self) -> "MetricsRegistry":
+        """Новый реестр с теми же метриками, но без значений"""
+        copy = MetricsRegistry()
+        for name, metric in self._metrics.items():
+            if isinstance(metric, Histogram):
+                copy.histogram(name, metric.documentation, metric.labelnames, metric.buckets[:-1])
+            else:
+                copy.counter(name, metric.documentation, metric.labelnames)
+        return copy
+
+    def load(self, state: dict) -> None:
+        """Добавляет к текущим значениям ранее сохранённое состояние"""
+        for name, values in state.items():
+            if name in self._metrics:
+                self._metrics[name].load(values)
+
+    def reset(self) -> None:
+        for metric in self._metrics.values():
+            metric.reset()
+
+
+REGISTRY = MetricsRegistry()
+
+QUERY_DURATION = REGISTRY.histogram(
+    "fia_query_duration_seconds", "Полное время обработки запроса", ("status",))
+STAGE_DURATION = REGISTRY.histogram(
+    "fia_stage_duration_seconds", "Время выполнения этапов обработки запроса", ("stage",))
+QUERIES = REGISTRY.counter(
+    "fia_queries", "Количество обработанных запросов", ("status",))
+ROWS_SCANNED = REGISTRY.histogram(
+    "fia_rows_scanned", "Количество строк, просмотренных при обработке запроса", buckets=ROWS_BUCKETS)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "fia_cache_lookups", "Обращения к кэшу по результату (hit, miss, expired, corrupt)", ("result",))
+LLM_REQUESTS = REGISTRY.counter(
+    "fia_llm_requests", "Количество HTTP-запросов к LLM API", ("model",))
+LLM_ERRORS = REGISTRY.counter(
+    "fia_llm_errors", "Количество ошибок LLM API", ("model", "reason"))
+LLM_RETRIES = REGISTRY.counter(
+    "fia_llm_retries", "Количество повторных запросов к LLM API", ("model",))
+LLM_TOKENS = REGISTRY.counter(
+    "fia_llm_tokens", "Использованные токены по данным ответа LLM API", ("model", "kind"))
+LLM_DURATION = REGISTRY.histogram(
+    "fia_llm_request_duration_seconds", "Время одного HTTP-запроса к LLM API", ("model",))
+
+
+class MetricsFileFlusher:
+    """Периодически сохраняет метрики в локальные файлы (режим CLI).
+
+    Каждый процесс добавляет к METRICS_STATE_FILE только свой прирост с прошлой
+    записи, под файловой блокировкой, поэтому параллельные запуски не затирают
+    друг друга. METRICS_TEXT_FILE содержит то же самое в формате Prometheus.
+    """
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, interval: float = METRICS_FLUSH_INTERVAL,
+                 state_file: Path = METRICS_STATE_FILE, text_file: Path = METRICS_TEXT_FILE):
+        self.registry = registry
+        self.interval = interval
+        self.state_file = Path(state_file)
+        self.text_file = Path(text_file)
+        self.lock_file = self.state_file.with_suffix(".lock")
+        self._flushed: dict = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._flush_lock = threading.Lock()
+
+    def start(self) -> None:
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        self.text_file.parent.mkdir(parents=True, exist_ok=True)
+        self._flushed = self.registry.dump()
+        self._thread = threading.Thread(target=self._run, name="metrics-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Останавливает фоновый поток и выполняет финальную запись"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def _read_state(self) -> dict:
+        if not self.state_file.exists():
+            return {}
+        try:
+            with open(self.state_file, "r") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError):
+            return {}
+
+    def flush(self) -> None:
+        """Добавляет прирост метрик с прошлой записи к состоянию на диске"""
+        with self._flush_lock, _file_lock(self.lock_file):
+            current = self.registry.dump()
+            snapshot = self.registry.empty_copy()
+            snapshot.load(self._read_state())
+            snapshot.load(_diff_state(current, self._flushed))
+            self._write(self.state_file, json.dumps(snapshot.dump()))
+            self._write(self.text_file, snapshot.render())
+            self._flushed = current
+
+    @staticmethod
+    def _write(path: Path, content: str) -> None:
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+def start_http_server(port: int = METRICS_PORT, host: str = "127.0.0.1", registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """Запускает HTTP-эндпоинт /metrics в фоновом потоке (режим сервера)"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    return server
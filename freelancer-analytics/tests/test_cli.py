@@ -0,0 +1,86 @@
+import importlib
+import os
+
+import pandas as pd
+import pytest
+
+from core import caching
+from core.caching import DataCache
+from core.llm_integration import LLMError
+from core.metrics import REGISTRY, QUERIES, QUERY_DURATION, CACHE_LOOKUPS
+
+QUERY = "Какой средний доход?"
+
+
+@pytest.fixture
+def cli(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENROUTER_API_KEY", "key")
+    monkeypatch.setenv("API_URL", "https://llm.test/v1/chat/completions")
+    # Settings проверяет путь к данным при импорте; сами данные подменяются ниже
+    with monkeypatch.context() as m:
+        m.setattr(os.path, "exists", lambda path: True)
+        main = importlib.import_module("cli.main")
+
+    monkeypatch.setattr(caching, "CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(main, "cache", DataCache())
+    df = pd.DataFrame({"Earnings_USD": [100.0, 200.0, 300.0]})
+    monkeypatch.setattr(main, "DataProcessor", lambda: type("Processor", (), {"get_data": lambda self: df})())
+    REGISTRY.reset()
+    yield main
+    REGISTRY.reset()
+
+
+def _fail(*args, **kwargs):
+    raise LLMError("Не удалось получить анализ: 503")
+
+
+def _count(metric, **labels):
+    return metric._values.get(metric._key(labels), {}).get("count", 0)
+
+
+def test_successful_query_is_ok_and_cached(cli, monkeypatch):
+    monkeypatch.setattr(cli.llm_generator, "generate_response", lambda query, stats: "Ответ")
+
+    cli._handle_query(QUERY, use_cache=True, verbose=False)
+    cli._handle_query(QUERY, use_cache=True, verbose=False)
+
+    assert QUERIES.get(status="ok") == 1
+    assert QUERIES.get(status="cached") == 1
+    assert CACHE_LOOKUPS.get(result="hit") == 1
+
+
+def test_llm_failure_is_recorded_and_not_cached(cli, monkeypatch):
+    monkeypatch.setattr(cli.llm_generator, "generate_response", _fail)
+
+    cli._handle_query(QUERY, use_cache=True, verbose=False)
+    cli._handle_query(QUERY, use_cache=True, verbose=False)
+
+    assert QUERIES.get(status="llm_error") == 2
+    assert QUERIES.get(status="ok") == 0
+    assert QUERIES.get(status="cached") == 0
+    assert _count(QUERY_DURATION, status="llm_error") == 2
+    assert _count(QUERY_DURATION, status="ok") == 0
+    assert CACHE_LOOKUPS.get(result="hit") == 0
+
+
+def test_missing_data_is_no_data_and_not_cached(cli, monkeypatch):
+    monkeypatch.setattr(cli.llm_generator, "generate_response", _fail)
+    query = "Какой процент фрилансеров, считающих себя экспертами, выполнил менее 100 проектов?"
+
+    cli._handle_query(query, use_cache=True, verbose=False)
+    cli._handle_query(query, use_cache=True, verbose=False)
+
+    assert QUERIES.get(status="no_data") == 2
+    assert QUERIES.get(status="cached") == 0
+
+
+def test_early_failure_is_recorded_as_error(cli, monkeypatch):
+    def broken_get(key):
+        raise ValueError("Invalid isoformat string")
+
+    monkeypatch.setattr(cli.cache, "get", broken_get)
+
+    with pytest.raises(ValueError):
+        cli._handle_query(QUERY, use_cache=True, verbose=False)
+    assert QUERIES.get(status="error") == 1
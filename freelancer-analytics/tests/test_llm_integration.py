@@ -0,0 +1,166 @@
+import json
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from core import llm_integration
+from core.llm_integration import LLMError, LLMGenerator
+from core.metrics import REGISTRY, LLM_REQUESTS, LLM_ERRORS, LLM_RETRIES, LLM_TOKENS
+
+MODEL = "test-model"
+OK_BODY = {
+    "choices": [{"message": {"content": "Ответ"}}],
+    "usage": {"prompt_tokens": 12, "completion_tokens": 5, "total_tokens": 17},
+}
+
+
+def _response(status_code=200, body=OK_BODY, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response.url = "https://llm.test/v1/chat/completions"
+    response._content = body if isinstance(body, bytes) else json.dumps(body).encode()
+    return response
+
+
+@pytest.fixture
+def generator(monkeypatch):
+    REGISTRY.reset()
+    monkeypatch.setattr(LLMGenerator, "RETRY_BACKOFF", 0)
+    settings = SimpleNamespace(OPENROUTER_API_KEY="key", API_URL="https://llm.test/v1/chat/completions", MODEL=MODEL)
+    yield LLMGenerator(settings)
+    REGISTRY.reset()
+
+
+def _patch_post(monkeypatch, outcomes):
+    calls = []
+
+    def fake_post(*args, **kwargs):
+        calls.append(kwargs)
+        outcome = outcomes[min(len(calls), len(outcomes)) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(llm_integration.requests, "post", fake_post)
+    return calls
+
+
+def test_success_records_request_and_tokens(generator, monkeypatch):
+    calls = _patch_post(monkeypatch, [_response()])
+
+    assert generator.generate_response("вопрос", {"average": 1.0}) == "Ответ"
+    assert len(calls) == 1
+    assert LLM_REQUESTS.get(model=MODEL) == 1
+    assert LLM_RETRIES.get(model=MODEL) == 0
+    assert LLM_TOKENS.get(model=MODEL, kind="prompt") == 12
+    assert LLM_TOKENS.get(model=MODEL, kind="completion") == 5
+
+
+@pytest.mark.parametrize("status_code", sorted(LLMGenerator.RETRY_STATUS_CODES))
+def test_retryable_status_is_retried(generator, monkeypatch, status_code):
+    calls = _patch_post(monkeypatch, [_response(status_code), _response()])
+
+    assert generator.generate_response("вопрос", {}) == "Ответ"
+    assert len(calls) == 2
+    assert LLM_RETRIES.get(model=MODEL) == 1
+    assert LLM_ERRORS.get(model=MODEL, reason=f"http_{status_code}") == 1
+
+
+@pytest.mark.parametrize("status_code", [400, 401, 404])
+def test_client_error_is_not_retried(generator, monkeypatch, status_code):
+    calls = _patch_post(monkeypatch, [_response(status_code)])
+
+    with pytest.raises(LLMError, match="Не удалось получить анализ"):
+        generator.generate_response("вопрос", {})
+    assert len(calls) == 1
+    assert LLM_RETRIES.get(model=MODEL) == 0
+    assert LLM_ERRORS.get(model=MODEL, reason=f"http_{status_code}") == 1
+
+
+def test_timeouts_exhaust_retries(generator, monkeypatch):
+    calls = _patch_post(monkeypatch, [requests.Timeout("timeout")])
+
+    with pytest.raises(LLMError, match="Не удалось получить анализ"):
+        generator.generate_response("вопрос", {})
+    assert len(calls) == LLMGenerator.MAX_RETRIES + 1
+    assert LLM_REQUESTS.get(model=MODEL) == LLMGenerator.MAX_RETRIES + 1
+    assert LLM_RETRIES.get(model=MODEL) == LLMGenerator.MAX_RETRIES
+    assert LLM_ERRORS.get(model=MODEL, reason="timeout") == LLMGenerator.MAX_RETRIES + 1
+
+
+def test_connection_error_is_retried(generator, monkeypatch):
+    calls = _patch_post(monkeypatch, [requests.ConnectionError("refused"), _response()])
+
+    assert generator.generate_response("вопрос", {}) == "Ответ"
+    assert len(calls) == 2
+    assert LLM_ERRORS.get(model=MODEL, reason="connection_error") == 1
+
+
+def test_bad_url_is_request_error(generator, monkeypatch):
+    calls = _patch_post(monkeypatch, [requests.exceptions.MissingSchema("no schema")])
+
+    with pytest.raises(LLMError):
+        generator.generate_response("вопрос", {})
+    assert len(calls) == 1
+    assert LLM_ERRORS.get(model=MODEL, reason="request_error") == 1
+    assert LLM_ERRORS.get(model=MODEL, reason="invalid_response") == 0
+
+
+@pytest.mark.parametrize("body", [b"not json", {"choices": []}, {"error": "x"}])
+def test_malformed_body_is_invalid_response(generator, monkeypatch, body):
+    calls = _patch_post(monkeypatch, [_response(200, body)])
+
+    with pytest.raises(LLMError, match="Не удалось получить анализ"):
+        generator.generate_response("вопрос", {})
+    assert len(calls) == 1
+    assert LLM_ERRORS.get(model=MODEL, reason="invalid_response") == 1
+    assert LLM_TOKENS.get(model=MODEL, kind="prompt") == 0
+
+
+@pytest.mark.parametrize("usage", ["12 tokens", [12, 5], None, {"prompt_tokens": "12"}])
+def test_malformed_usage_does_not_fail_response(generator, monkeypatch, usage):
+    _patch_post(monkeypatch, [_response(body={**OK_BODY, "usage": usage})])
+
+    assert generator.generate_response("вопрос", {}) == "Ответ"
+    assert LLM_TOKENS.get(model=MODEL, kind="prompt") == 0
+    assert LLM_ERRORS.get(model=MODEL, reason="invalid_response") == 0
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("7", 7.0),
+    ("0.5", 0.5),
+    ("3600", LLMGenerator.MAX_RETRY_AFTER),
+    ("-5", 0.0),
+    ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0),
+])
+def test_retry_after_header_sets_delay(generator, monkeypatch, header, expected):
+    sleeps = []
+    monkeypatch.setattr(llm_integration.time, "sleep", sleeps.append)
+    _patch_post(monkeypatch, [_response(429, headers={"Retry-After": header}), _response()])
+
+    assert generator.generate_response("вопрос", {}) == "Ответ"
+    assert sleeps == [expected]
+
+
+def test_retry_after_future_date_is_used(generator, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(llm_integration.time, "sleep", sleeps.append)
+    retry_at = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=10), usegmt=True)
+    _patch_post(monkeypatch, [_response(503, headers={"Retry-After": retry_at}), _response()])
+
+    generator.generate_response("вопрос", {})
+    assert 8 <= sleeps[0] <= 10
+
+
+def test_backoff_is_used_without_retry_after(generator, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(llm_integration.time, "sleep", sleeps.append)
+    monkeypatch.setattr(LLMGenerator, "RETRY_BACKOFF", 1.0)
+    _patch_post(monkeypatch, [_response(429, headers={"Retry-After": "soon"}), _response(500), _response()])
+
+    assert generator.generate_response("вопрос", {}) == "Ответ"
+    assert sleeps == [1.0, 2.0]
@@ -0,0 +1,122 @@
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from core.metrics import CONTENT_TYPE, Counter, Histogram, MetricsRegistry, MetricsFileFlusher, start_http_server
+
+
+def _registry():
+    registry = MetricsRegistry()
+    registry.counter("fia_test", "Тестовый счётчик", ("status",))
+    registry.histogram("fia_test_seconds", "Тестовая гистограмма", buckets=(0.1, 1.0))
+    return registry
+
+
+def test_counter_render_uses_total_name_in_metadata():
+    counter = Counter("fia_test", "Тестовый счётчик", ("status",))
+    counter.inc(status="ok")
+    counter.inc(2, status="ok")
+
+    assert counter.render() == [
+        "# HELP fia_test_total Тестовый счётчик",
+        "# TYPE fia_test_total counter",
+        'fia_test_total{status="ok"} 3',
+    ]
+
+
+def test_counter_rejects_wrong_labels_and_negative_amount():
+    counter = Counter("fia_test", "Тестовый счётчик", ("status",))
+    with pytest.raises(ValueError):
+        counter.inc(reason="x")
+    with pytest.raises(ValueError):
+        counter.inc(-1, status="ok")
+
+
+def test_histogram_render_is_cumulative_with_inf_bucket():
+    histogram = Histogram("fia_test_seconds", "Тестовая гистограмма", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value)
+
+    assert histogram.render() == [
+        "# HELP fia_test_seconds Тестовая гистограмма",
+        "# TYPE fia_test_seconds histogram",
+        'fia_test_seconds_bucket{le="0.1"} 1',
+        'fia_test_seconds_bucket{le="1"} 3',
+        'fia_test_seconds_bucket{le="+Inf"} 4',
+        "fia_test_seconds_sum 4.25",
+        "fia_test_seconds_count 4",
+    ]
+
+
+def test_label_values_are_escaped():
+    counter = Counter("fia_test", "Тестовый счётчик", ("reason",))
+    counter.inc(reason='a"b\\c\nd')
+
+    assert counter.render()[-1] == 'fia_test_total{reason="a\\"b\\\\c\\nd"} 1'
+
+
+def test_flusher_merges_state_of_two_instances(tmp_path):
+    state_file, text_file = tmp_path / "metrics.json", tmp_path / "metrics.prom"
+    first, second = _registry(), _registry()
+    first_flusher = MetricsFileFlusher(first, 60, state_file, text_file)
+    second_flusher = MetricsFileFlusher(second, 60, state_file, text_file)
+    first_flusher.start()
+    second_flusher.start()
+
+    first._metrics["fia_test"].inc(status="ok")
+    first._metrics["fia_test_seconds"].observe(0.5)
+    first_flusher.flush()
+    second._metrics["fia_test"].inc(2, status="ok")
+    second_flusher.flush()
+    # Повторная запись не должна дублировать уже сохранённый прирост
+    first._metrics["fia_test"].inc(status="ok")
+    first_flusher.stop()
+    second_flusher.stop()
+
+    merged = _registry()
+    merged.load(first_flusher._read_state())
+    assert merged._metrics["fia_test"].get(status="ok") == 4
+    assert 'fia_test_total{status="ok"} 4' in text_file.read_text()
+    assert "fia_test_seconds_count 1" in text_file.read_text()
+
+
+def test_flusher_handles_concurrent_flushes(tmp_path):
+    state_file, text_file = tmp_path / "metrics.json", tmp_path / "metrics.prom"
+    registries = [_registry() for _ in range(4)]
+    flushers = [MetricsFileFlusher(r, 60, state_file, text_file) for r in registries]
+    for flusher in flushers:
+        flusher.start()
+
+    def work(registry, flusher):
+        for _ in range(25):
+            registry._metrics["fia_test"].inc(status="ok")
+            flusher.flush()
+
+    threads = [threading.Thread(target=work, args=pair) for pair in zip(registries, flushers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for flusher in flushers:
+        flusher.stop()
+
+    assert 'fia_test_total{status="ok"} 100' in text_file.read_text()
+
+
+def test_http_server_serves_metrics_on_localhost():
+    registry = _registry()
+    registry._metrics["fia_test"].inc(status="ok")
+    server = start_http_server(port=0, registry=registry)
+    host, port = server.server_address
+    try:
+        assert host == "127.0.0.1"
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+            assert response.headers["Content-Type"] == CONTENT_TYPE
+            assert 'fia_test_total{status="ok"} 1' in response.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://{host}:{port}/other")
+    finally:
+        server.shutdown()
+        server.server_close()